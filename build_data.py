@@ -1,9 +1,35 @@
+"""Generates the shell instruction fine-tuning dataset.
+
+The generation hot path is pure Python, so running this script under PyPy
+(`pypy3 build_data.py`) gives a further multiple speedup from the JIT with
+no code changes. orjson is CPython-only and therefore optional: without it
+the writer falls back to stdlib json for the two escaped string fields.
+"""
+
+import itertools
 import json
+import multiprocessing
+import os
 import random
+import re
+import string
+
+try:
+    import orjson
+except ImportError:  # e.g. under PyPy
+    orjson = None
+
+if orjson is not None:
+    _dump_str = orjson.dumps
+else:
+
+    def _dump_str(s):
+        return json.dumps(s).encode()
 
 # --- CONFIGURATION ---
 TARGET_COUNT = 20000
 OUTPUT_FILE = "shell_instruct_dataset_v2.jsonl"
+GEN_BATCH = 1024  # entries drawn per batched random pass
 
 # --- DATA POOLS ---
 FILENAMES = [
@@ -107,16 +133,32 @@ NL_MAPPING = {
 }
 
 
+# Compiled alternation over all intent keywords, used only at import time to
+# precompute which templates can contain a keyword at all; the per-prompt
+# path below stays a plain word loop, which beats an IGNORECASE alternation
+# plus Python callback on these short (~6-10 word) prompts.
+_NL_KEYS = sorted(NL_MAPPING, key=len, reverse=True)
+_NL_PATTERN = re.compile(
+    r"\b(" + "|".join(map(re.escape, _NL_KEYS)) + r")\b", re.IGNORECASE
+)
+
+
+# Synonym tuples keyed by the case variants template text can produce, so
+# the word loop resolves each word with one dict probe instead of calling
+# str.lower on every word first.
+_NL_CHOICES = {}
+for _key, _synonyms in NL_MAPPING.items():
+    _synonyms = tuple(_synonyms)
+    for _variant in (_key, _key.capitalize(), _key.upper()):
+        _NL_CHOICES[_variant] = _synonyms
+
+
 def get_natural_prompt(base_prompt):
     """Replaces standard keywords with random conversational synonyms."""
-    words = base_prompt.split()
     new_words = []
-    for word in words:
-        lower_word = word.lower()
-        if lower_word in NL_MAPPING:
-            new_words.append(random.choice(NL_MAPPING[lower_word]))
-        else:
-            new_words.append(word)
+    for word in base_prompt.split():
+        choices = _NL_CHOICES.get(word)
+        new_words.append(random.choice(choices) if choices is not None else word)
     return " ".join(new_words)
 
 
@@ -216,113 +258,240 @@ COMPLEX_TEMPLATES = [
 ]
 
 
-def generate_entry():
-    """Generates a single random entry."""
-    is_complex = random.random() < 0.3  # 30% chance of complex command
+# Fixed slot per field name; templates render against a plain value tuple so
+# the hot loop indexes in C instead of hashing dict keys.
+_FIELD_SLOTS = {"target": 0, "path": 1, "term": 2, "service": 3, "port": 4}
 
-    target = f"{random.choice(FILENAMES)}{random.choice(EXTENSIONS)}"
-    path = random.choice(PATHS)
-    term = random.choice(SEARCH_TERMS)
-    service = random.choice(SERVICES)
-    port = str(random.randint(1000, 9000))
 
-    if is_complex:
-        template = random.choice(COMPLEX_TEMPLATES)
-        prompt = template["prompt"].format(
-            target=target, path=path, term=term, service=service, port=port
-        )
-        prompt = get_natural_prompt(prompt)  # Naturalize
+def _parse_template(tpl):
+    """Pre-parses a format string into (literal, value-slot) segments."""
+    return tuple(
+        (literal, _FIELD_SLOTS[field] if field else None)
+        for literal, field, _, _ in string.Formatter().parse(tpl)
+    )
 
-        bash_cmd = template["bash"].format(
-            target=target, path=path, term=term, service=service, port=port
-        )
-        ps_cmd = template["ps"].format(
-            target=target, path=path, term=term, service=service, port=port
-        )
 
-        # Return both variants to balance dataset
-        return [
-            {
-                "prompt": prompt,
-                "command": bash_cmd,
-                "dangerous": template["dangerous"],
-                "shell": "bash",
-            },
-            {
-                "prompt": prompt,
-                "command": ps_cmd,
-                "dangerous": template["dangerous"],
-                "shell": "powershell",
-            },
-        ]
+def _render(parts, values):
+    """Renders pre-parsed template segments against a value tuple."""
+    return "".join(
+        literal + (values[slot] if slot is not None else "")
+        for literal, slot in parts
+    )
 
-    else:
-        template = random.choice(SIMPLE_TEMPLATES)
-        bash_flags, ps_flags, prompt_suffix = random.choice(template["variations"])
 
-        # Build Prompt
-        base_prompt = f"{template['intent']} {prompt_suffix}"
-        base_prompt = base_prompt.format(target=target, path=path, term=term)
-        final_prompt = get_natural_prompt(base_prompt)
+def _with_flags(tpl, flags):
+    """Substitutes a flag string into a command template, collapsing the
+    double space an empty flag set leaves behind."""
+    return " ".join(tpl.replace("{flags}", flags).split())
+
 
-        # Build Commands
-        bash_cmd = template["bash"].format(
-            flags=bash_flags, target=target, path=path, term=term
+# Pre-parse every template once at import so generate_entry doesn't re-run
+# the str.format state machine on each of the 40k+ calls. Simple-template
+# flags are baked into a per-variation template here, already trimmed, so
+# rendering needs no post-hoc whitespace cleanup.
+for _template in SIMPLE_TEMPLATES:
+    _template["_variations"] = [
+        (
+            _parse_template(suffix),
+            _parse_template(_with_flags(_template["bash"], bash_flags)),
+            _parse_template(_with_flags(_template["ps"], ps_flags)),
         )
-        ps_cmd = template["ps"].format(
-            flags=ps_flags, target=target, path=path, term=term
+        for bash_flags, ps_flags, suffix in _template["variations"]
+    ]
+
+# Flat (template, variation) table so generation draws one row instead of
+# chaining a template choice and a variation choice. Cumulative weights keep
+# the original two-stage distribution: uniform over templates, then uniform
+# over each template's variations.
+SIMPLE_TABLE = [
+    (_template, _variation)
+    for _template in SIMPLE_TEMPLATES
+    for _variation in _template["_variations"]
+]
+SIMPLE_CUM_WEIGHTS = list(
+    itertools.accumulate(
+        1.0 / len(_template["_variations"])
+        for _template in SIMPLE_TEMPLATES
+        for _variation in _template["_variations"]
+    )
+)
+
+for _template in COMPLEX_TEMPLATES:
+    _template["_prompt_parts"] = _parse_template(_template["prompt"])
+    _template["_bash_parts"] = _parse_template(_template["bash"])
+    _template["_ps_parts"] = _parse_template(_template["ps"])
+    # Keywords can only come from the template literals (no data pool value
+    # contains one), so whether naturalization can do anything is knowable
+    # up front; templates without a hit skip get_natural_prompt entirely.
+    _template["_has_nl"] = bool(_NL_PATTERN.search(_template["prompt"]))
+
+
+def generate_entries(count, rng=random):
+    """Generates `count` random entry pairs with batched random draws.
+
+    Drawing each value stream once with rng.choices(k=count) amortizes the
+    choice machinery over the whole batch instead of paying per-call
+    overhead for every field of every entry. `rng` accepts any object with
+    the random module's API, e.g. a worker-local random.Random.
+    """
+    filenames = rng.choices(FILENAMES, k=count)
+    extensions = rng.choices(EXTENSIONS, k=count)
+    paths = rng.choices(PATHS, k=count)
+    terms = rng.choices(SEARCH_TERMS, k=count)
+    services = rng.choices(SERVICES, k=count)
+    # 30% chance of complex command
+    complex_rolls = rng.choices((True, False), cum_weights=(3, 10), k=count)
+    complex_picks = rng.choices(COMPLEX_TEMPLATES, k=count)
+    simple_picks = rng.choices(
+        SIMPLE_TABLE, cum_weights=SIMPLE_CUM_WEIGHTS, k=count
+    )
+
+    randint = rng.randint
+    entries = []
+    for i in range(count):
+        # (target, path, term, service, port) in _FIELD_SLOTS order
+        values = (
+            filenames[i] + extensions[i],
+            paths[i],
+            terms[i],
+            services[i],
+            str(randint(1000, 9000)),
         )
+        entries.extend(_build_pair(complex_rolls[i], complex_picks[i],
+                                   simple_picks[i], values))
+    return entries
 
-        # Clean double spaces
-        bash_cmd = " ".join(bash_cmd.split())
-        ps_cmd = " ".join(ps_cmd.split())
 
-        danger = template.get("dangerous", False)
+def _build_pair(is_complex, complex_template, simple_pick, values):
+    """Renders the bash/powershell entry pair for one set of drawn values.
 
-        return [
-            {
-                "prompt": final_prompt,
-                "command": bash_cmd,
-                "dangerous": danger,
-                "shell": "bash",
-            },
-            {
-                "prompt": final_prompt,
-                "command": ps_cmd,
-                "dangerous": danger,
-                "shell": "powershell",
-            },
-        ]
+    The prompt and danger flag are shared between both shell variants, so
+    they are computed once here and only the command differs per entry.
+    """
+    if is_complex:
+        template = complex_template
+        prompt = _render(template["_prompt_parts"], values)
+        if template["_has_nl"]:
+            prompt = get_natural_prompt(prompt)  # Naturalize
+        bash_cmd = _render(template["_bash_parts"], values)
+        ps_cmd = _render(template["_ps_parts"], values)
+    else:
+        template, (suffix_parts, bash_parts, ps_parts) = simple_pick
+        # Flags are already baked into the command parts and trimmed
+        prompt = get_natural_prompt(
+            f"{template['intent']} {_render(suffix_parts, values)}"
+        )
+        bash_cmd = _render(bash_parts, values)
+        ps_cmd = _render(ps_parts, values)
+
+    danger = template.get("dangerous", False)
+
+    # Return both variants to balance dataset
+    return [
+        {
+            "prompt": prompt,
+            "command": bash_cmd,
+            "dangerous": danger,
+            "shell": "bash",
+        },
+        {
+            "prompt": prompt,
+            "command": ps_cmd,
+            "dangerous": danger,
+            "shell": "powershell",
+        },
+    ]
+
+
+def _generate_chunk(count):
+    """Pool worker: generates one batch with a chunk-local RNG.
+
+    The RNG is a random.Random seeded from os.urandom, so forked workers
+    never replay the state inherited from the parent and its bound methods
+    skip the module-global indirection in the draw loop. Within-chunk
+    duplicates are dropped here so they are never pickled back to the
+    parent or re-hashed against the global set.
+    """
+    rng = random.Random(os.urandom(16))
+    seen = set()
+    unique = []
+    for entry in generate_entries(count, rng):
+        key = (entry["prompt"], entry["command"])
+        if key not in seen:
+            seen.add(key)
+            unique.append(entry)
+    return unique
+
+
+def _render_line(prompt, command, dangerous, shell):
+    """Hand-rolls the JSON line for the fixed flat schema.
+
+    Only the two free-text fields need real escaping (quotes, backslashes
+    in Windows paths); the rest of the object is assembled literally, which
+    skips building and walking a dict per entry.
+    """
+    return (
+        b'{"prompt":' + _dump_str(prompt)
+        + b',"command":' + _dump_str(command)
+        + b',"dangerous":' + (b"true" if dangerous else b"false")
+        + b',"shell":"' + shell.encode() + b'"}'
+    )
 
 
 def main():
     print(f"Generating unique examples...")
 
     unique_hashes = set()
-    dataset = []
-
-    while len(dataset) < TARGET_COUNT:
-        entries = generate_entry()
-        for entry in entries:
-            # Create a unique signature for deduplication
-            entry_hash = f"{entry['prompt']}_{entry['command']}"
-
-            if entry_hash not in unique_hashes:
-                unique_hashes.add(entry_hash)
-                dataset.append(entry)
-
-                if len(dataset) % 5000 == 0:
-                    print(f"Generated {len(dataset)} items...")
-
-    # Shuffle final dataset
-    random.shuffle(dataset)
-
-    # Write to file
-    with open(OUTPUT_FILE, "w") as f:
-        for entry in dataset:
-            f.write(json.dumps(entry) + "\n")
+    # Struct-of-arrays: one column per field instead of 40k small dicts,
+    # which drops the per-entry dict overhead while the dataset is resident
+    prompts = []
+    commands = []
+    dangers = []
+    shells = []
+    next_report = 5000
+    workers = os.cpu_count() or 1
+
+    with multiprocessing.Pool(workers) as pool:
+        for chunk in pool.imap_unordered(
+            _generate_chunk, itertools.repeat(GEN_BATCH)
+        ):
+            for entry in chunk:
+                # Unique signature for deduplication; tuples hash in C
+                # without allocating a concatenated string per candidate
+                entry_hash = (entry["prompt"], entry["command"])
+
+                if entry_hash not in unique_hashes:
+                    unique_hashes.add(entry_hash)
+                    prompts.append(entry["prompt"])
+                    commands.append(entry["command"])
+                    dangers.append(entry["dangerous"])
+                    shells.append(entry["shell"])
+
+                    if len(prompts) >= next_report:
+                        next_report += 5000
+                        print(f"Generated {len(prompts)} items...")
+
+                    if len(prompts) == TARGET_COUNT:
+                        break
+
+            if len(prompts) == TARGET_COUNT:
+                break
+
+    # Shuffle via a shared index permutation applied to every column;
+    # sample() builds the permutation in one pass instead of materializing
+    # range() and shuffling it in a second
+    order = random.Random(os.urandom(16)).sample(range(len(prompts)), len(prompts))
+
+    # Stream rendered lines through the writer's buffer instead of joining
+    # one multi-megabyte bytes object before writing; peak memory stays at
+    # the buffer size rather than a full serialized copy of the dataset
+    with open(OUTPUT_FILE, "wb") as f:
+        f.writelines(
+            _render_line(prompts[i], commands[i], dangers[i], shells[i]) + b"\n"
+            for i in order
+        )
 
-    print(f"Done! Saved {len(dataset)} examples to {OUTPUT_FILE}")
+    print(f"Done! Saved {len(prompts)} examples to {OUTPUT_FILE}")
 
 
 if __name__ == "__main__":